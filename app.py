@@ -3,9 +3,9 @@ from werkzeug.utils import secure_filename
 import os
 import io
 import matplotlib.pyplot as plt
-from tools import Parser, MotifFinder
-from sequence import MitochondrialDNA
+from tools import FastaIndex, MotifFinder, Parser, sequence_digest
 from comparer import SequenceComparer
+from compression import COMPRESSED_EXTENSIONS
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'fasta', 'fa', 'fna'}
@@ -19,34 +19,71 @@ if not os.path.exists(UPLOAD_FOLDER):
 
 class FastaManager:
     def __init__(self):
-        self.sequences = []  # List of MitochondrialDNA
+        self.records = []  # (FastaIndex or None if loaded eagerly, record name) per distinct sequence, in upload order
+        self.aliases = []  # names of the other records carrying the same sequence
+        self.__digests = {}  # sequence hash -> record position
+        self.__loaded = {}  # record position -> MitochondrialDNA, filled on demand
         self.motif_results = None
 
     def parse(self, filepath):
-        parser = Parser('fasta')
-        df = parser.run(filepath)
-        mito_objs = [MitochondrialDNA(df.loc[i]) for i in range(len(df))]
-        self.sequences.extend(mito_objs)
+        index = FastaIndex()
+        try:
+            index.run(filepath)
+            entries = [(index, name, index.digest(name), None) for name in index.names]
+            index.close()
+        except ValueError:
+            # files the index cannot describe (uneven line widths, repeated names) are read whole
+            objects = Parser().run(filepath, return_objects=True)
+            entries = [(None, obj.name, sequence_digest(obj.encoded), obj) for obj in objects]
+        # identical sequences are stored once; re-uploading a file adds no new records
+        for index, name, digest, obj in entries:
+            if digest not in self.__digests:
+                self.__digests[digest] = len(self.records)
+                if obj is not None:
+                    self.__loaded[len(self.records)] = obj
+                self.records.append((index, name))
+                self.aliases.append([])
+                continue
+            pos = self.__digests[digest]
+            if name != self.records[pos][1] and name not in self.aliases[pos]:
+                self.aliases[pos].append(name)
+
+    def get_sequence(self, idx):
+        if idx not in self.__loaded:
+            index, name = self.records[idx]
+            if index.random_access:
+                self.__loaded[idx] = index.fetch(name)
+            else:
+                # a plain gzip file is inflated whole, so its records are loaded together and the copy released
+                for pos, (other, other_name) in enumerate(self.records):
+                    if other is index and pos not in self.__loaded:
+                        self.__loaded[pos] = index.fetch(other_name)
+                index.close()
+        return self.__loaded[idx]
+
+    def get_length(self, idx):
+        index, name = self.records[idx]
+        return index.length(name) if index is not None else self.__loaded[idx].length
 
     def get_stats(self):
-        if not self.sequences:
+        if not self.records:
             return {}
-        lengths = [obj.length for obj in self.sequences]
+        lengths = [self.get_length(i) for i in range(len(self.records))]
         return {
-            'count': len(self.sequences),
+            'count': len(self.records),
             'min_length': min(lengths),
             'max_length': max(lengths),
             'mean_length': sum(lengths) / len(lengths),
         }
 
     def get_gc_contents(self):
-        return [obj.gc_content for obj in self.sequences]
+        return [obj.gc_content for obj in self.get_sequences()]
 
     def get_names(self):
-        return [obj.name for obj in self.sequences]
+        return [' / '.join([name, *aliases]) for (_, name), aliases in zip(self.records, self.aliases)]
 
     def get_sequences(self):
-        return self.sequences
+        return [self.get_sequence(i) for i in range(len(self.records))]
 
 fasta_manager = FastaManager()
 
@@ -61,8 +98,7 @@ def index():
             flash('No selected file')
             return redirect(request.url)
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            filepath = unique_upload_path(secure_filename(file.filename))
             file.save(filepath)
             try:
                 fasta_manager.parse(filepath)
@@ -74,11 +110,25 @@ def index():
         else:
             flash('Invalid file type!')
             return redirect(request.url)
-    uploaded_files = os.listdir(app.config['UPLOAD_FOLDER'])
+    uploaded_files = [f for f in os.listdir(app.config['UPLOAD_FOLDER']) if allowed_file(f)]
     return render_template('index.html', fasta_manager=fasta_manager, uploaded_files=uploaded_files)
 
+def unique_upload_path(filename):
+    # records are read from the uploaded file on demand, so an earlier upload is never overwritten
+    stem, dot, extension = filename.partition('.')
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    copy = 1
+    while os.path.exists(filepath):
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f'{stem}-{copy}{dot}{extension}')
+        copy += 1
+    return filepath
+
 def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    parts = filename.lower().rsplit('.', 2)
+    # name.fasta.gz / name.fa.bgz are accepted as well
+    if len(parts) == 3 and parts[2] in COMPRESSED_EXTENSIONS:
+        parts = parts[:2]
+    return len(parts) > 1 and parts[-1] in ALLOWED_EXTENSIONS
 
 @app.route('/summary')
 def summary():
@@ -95,7 +145,7 @@ def motif():
     discovered = None
     finder = MotifFinder()
     sequences = fasta_manager.get_sequences()
-    max_length = max([s.length for s in sequences]) if sequences else 1
+    max_length = fasta_manager.get_stats().get('max_length', 1)
 
     if request.method == 'POST':
         motif_str = request.form.get('motif')
@@ -129,8 +179,10 @@ def align():
         mismatch = int(request.form.get('mismatch', -1))
         gap = int(request.form.get('gap', -2))
 
-        comparer = SequenceComparer(fasta_manager.get_sequences(), match=match, mismatch=mismatch, gap=gap)
-        result = comparer.compare_pair(idx1, idx2, method)
+        # only the two selected records are loaded from disk
+        pair = [fasta_manager.get_sequence(idx1), fasta_manager.get_sequence(idx2)]
+        comparer = SequenceComparer(pair, match=match, mismatch=mismatch, gap=gap)
+        result = comparer.compare_pair(0, 1, method)
         result['seq1_name'] = names[idx1]
         result['seq2_name'] = names[idx2]
 
@@ -154,6 +206,8 @@ def compare_reference():
 
         comparer = SequenceComparer(fasta_manager.get_sequences(), match=match, mismatch=mismatch, gap=gap)
         comparison_results = comparer.compare_to_reference(ref_idx, method)
+        # variant calling always aligns globally, so the comparison method is not passed on
+        variant_args = {'reference_seq': ref_idx, 'match': match, 'mismatch': mismatch, 'gap': gap}
         reference_name = names[ref_idx]
 
         # Add sequence names to results for display
@@ -168,7 +222,28 @@ def compare_reference():
     return render_template('compare_reference.html',
                            indexed_names=list(enumerate(names)),
                            comparison_results=comparison_results,
-                           reference_name=reference_name if 'reference_name' in locals() else None)
+                           reference_name=reference_name if 'reference_name' in locals() else None,
+                           variant_args=variant_args if comparison_results else None)
+
+@app.route('/variants.<fmt>')
+def variants_file(fmt):
+    if fmt not in ('vcf', 'tsv') or not fasta_manager.records:
+        return "", 404
+    ref_idx = int(request.args.get('reference_seq', 0))
+    if ref_idx not in range(len(fasta_manager.records)):
+        return "", 404
+    match = int(request.args.get('match', 2))
+    mismatch = int(request.args.get('mismatch', -1))
+    gap = int(request.args.get('gap', -2))
+
+    comparer = SequenceComparer(fasta_manager.get_sequences(), match=match, mismatch=mismatch, gap=gap)
+    caller = comparer.call_variants(ref_idx)
+    if fmt == 'vcf':
+        data = caller.to_vcf(contig=fasta_manager.records[ref_idx][1])
+    else:
+        data = caller.get_result()['frequencies'].to_csv(sep='\t', index=False)
+    return send_file(io.BytesIO(data.encode()), mimetype='text/plain',
+                     as_attachment=True, download_name=f'variants.{fmt}')
 
 @app.route('/plot.png')
 def plot_png():
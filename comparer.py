@@ -1,16 +1,20 @@
 from sequence import MitochondrialDNA
-from tools import SequenceAligner, MotifFinder
+from tools import SequenceAligner, BatchAligner, MotifFinder, VariantCaller
 from typing import List
 import multiprocessing
 
 class SequenceAlignWrapper:
     def __init__(self, match: int = 2, mismatch: int = -1, gap: int = -2):
         self.aligner = SequenceAligner(match=match, mismatch=mismatch, gap=gap)
+        self.batch_aligner = BatchAligner(match=match, mismatch=mismatch, gap=gap)
 
-    def align(self, seq1: str, seq2: str, method: str = 'global'):
+    def align(self, seq1, seq2, method: str = 'global'):
         self.aligner.run(seq1, seq2, method=method)
         return self.aligner.get_alignment_data()
 
+    def score_batch(self, reference, targets: List, method: str = 'global'):
+        return self.batch_aligner.run(reference, targets, method=method)
+
     def report(self):
         self.aligner.report()
 
@@ -20,7 +24,7 @@ class AlignmentVisualizer:
         self.aligner = aligner
 
     def display(self, idx1: int, idx2: int, sequences: List[MitochondrialDNA], method: str = 'global', width: int = 80):
-        result = self.aligner.align(sequences[idx1].sequence, sequences[idx2].sequence, method=method)
+        result = self.aligner.align(sequences[idx1].encoded, sequences[idx2].encoded, method=method)
         a1, a2, m = result['aligned_seq1'], result['aligned_seq2'], result['matches']
 
         print(f"Alignment between sequence {idx1} and {idx2} ({method}):\n")
@@ -40,7 +44,7 @@ class SequenceComparer:
         self.wrapper = SequenceAlignWrapper(match=match, mismatch=mismatch, gap=gap)
 
     def compare_pair(self, idx1: int, idx2: int, method: str = 'global'):
-        return self.wrapper.align(self.sequences[idx1].sequence, self.sequences[idx2].sequence, method)
+        return self.wrapper.align(self.sequences[idx1].encoded, self.sequences[idx2].encoded, method)
 
     def compare_all(self):
         results = []
@@ -57,11 +61,12 @@ class SequenceComparer:
         return results
 
     def compare_to_reference(self, ref_index: int = 0, method: str = 'global'):
+        # no traceback is needed for the summary, so all targets are scored in one batch
+        others = [i for i in range(len(self.sequences)) if i != ref_index]
+        scores = self.wrapper.score_batch(self.sequences[ref_index].encoded,
+                                          [self.sequences[i].encoded for i in others], method=method)
         results = []
-        for i in range(len(self.sequences)):
-            if i == ref_index:
-                continue
-            data = self.compare_pair(ref_index, i, method=method)
+        for i, data in zip(others, scores):
             results.append({
                 'reference_vs': i,
                 'score': data['score'],
@@ -69,4 +74,12 @@ class SequenceComparer:
                 'mismatches': data['mismatch_count'],
                 'gaps': data['gap_count']
             })
-        return results
\ No newline at end of file
+        return results
+
+    def call_variants(self, ref_index: int = 0):
+        # variants need the traceback, so every sample gets a full global alignment
+        others = [i for i in range(len(self.sequences)) if i != ref_index]
+        alignments = [self.compare_pair(ref_index, i, method='global') for i in others]
+        caller = VariantCaller()
+        caller.run(self.sequences[ref_index].sequence, alignments, [self.sequences[i].name for i in others])
+        return caller
@@ -0,0 +1,177 @@
+import gzip
+import io
+import mmap
+import os
+import struct
+import zlib
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+
+COMPRESSED_EXTENSIONS = {'gz', 'bgz'}
+GZIP_MAGIC = b'\x1f\x8b'
+# raised while inflating a truncated or corrupted gzip/BGZF file
+DECOMPRESSION_ERRORS = (EOFError, gzip.BadGzipFile, zlib.error, struct.error)
+
+
+def compression_type(path):
+    '''
+    :param path: path to a file
+    :return: 'bgzf', 'gzip' or None for an uncompressed file
+    '''
+    with open(path, 'rb') as f:
+        head = f.read(18)
+    if not head.startswith(GZIP_MAGIC):
+        return None
+    # BGZF blocks carry a 'BC' extra subfield holding the block size
+    if len(head) == 18 and head[3] & 4 and head[12:14] == b'BC' and head[14:16] == b'\x02\x00':
+        return 'bgzf'
+    return 'gzip'
+
+
+def open_fasta(path, mode='rt'):
+    '''
+    Opens a plain, gzip or BGZF file, decompressing on the fly.
+    :param path: path to the file
+    :param mode: 'rt' for text, 'rb' for bytes
+    :return: a file-like object
+    '''
+    kind = compression_type(path)
+    if kind == 'bgzf':
+        raw = io.BufferedReader(_ChunkStream(BgzfReader(path).iter_chunks()))
+    elif kind == 'gzip':
+        raw = gzip.open(path, 'rb')
+    else:
+        raw = open(path, 'rb')
+    if 't' in mode:
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    return raw
+
+
+class _ChunkStream(io.RawIOBase):
+    def __init__(self, chunks):
+        '''
+        :param chunks: iterator of bytes, exposed as a readable stream
+        '''
+        self.__chunks = chunks
+        self.__pending = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.__pending:
+            self.__pending = next(self.__chunks, None)
+            if self.__pending is None:
+                self.__pending = b''
+                return 0
+        size = min(len(buffer), len(self.__pending))
+        buffer[:size] = self.__pending[:size]
+        self.__pending = self.__pending[size:]
+        return size
+
+
+class BgzfReader:
+    def __init__(self, path, threads: int = None):
+        '''
+        :param path: path to a BGZF (bgzip) file
+        :param threads: number of blocks inflated in parallel, defaults to the CPU count (max 8)
+        '''
+        self.path = path
+        self.threads = threads or min(8, os.cpu_count() or 1)
+        self.index_path = path + '.gzi'
+        self.__compressed, self.__uncompressed = self._scan(*self._load_index())
+
+    def _load_index(self):
+        '''
+        :return: compressed and uncompressed block start offsets from the .gzi file, or only the
+            first block if the .gzi is missing, older than the file or does not fit it
+        '''
+        first = [0], [0]
+        if not os.path.exists(self.index_path) or os.path.getmtime(self.index_path) < os.path.getmtime(self.path):
+            return first
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        count = struct.unpack_from('<Q', data)[0] if len(data) >= 8 else None
+        if count is None or len(data) != 8 + 16 * count:
+            return first
+        pairs = struct.unpack_from(f'<{2 * count}Q', data, 8)
+        if count and pairs[-2] >= os.path.getsize(self.path):
+            return first
+        return [0, *pairs[0::2]], [0, *pairs[1::2]]
+
+    def _scan(self, compressed, uncompressed):
+        '''
+        Walks the block headers and trailers from the last known block; BSIZE gives the block
+        length and ISIZE the inflated size, so no block is decompressed.
+        :param compressed: compressed start offsets of the blocks already known
+        :param uncompressed: uncompressed start offsets of the same blocks
+        :return: compressed and uncompressed start offsets of every block, plus both file ends
+        '''
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset, size = compressed[-1], len(mm)
+            while offset < size:
+                if mm[offset:offset + 2] != GZIP_MAGIC:
+                    raise ValueError(f"Corrupted BGZF block at offset {offset} in {self.path}")
+                try:
+                    block_size = struct.unpack_from('<H', mm, offset + 16)[0] + 1
+                    inflated, = struct.unpack_from('<I', mm, offset + block_size - 4)
+                except struct.error:
+                    raise ValueError(f"Truncated BGZF block at offset {offset} in {self.path}")
+                offset += block_size
+                compressed.append(offset)
+                uncompressed.append(uncompressed[-1] + inflated)
+        return compressed, uncompressed
+
+    def write_index(self):
+        '''
+        Writes a bgzip-compatible .gzi file (block offsets after the first block).
+        '''
+        pairs = list(zip(self.__compressed[1:-1], self.__uncompressed[1:-1]))
+        with open(self.index_path, 'wb') as f:
+            f.write(struct.pack('<Q', len(pairs)))
+            for pair in pairs:
+                f.write(struct.pack('<QQ', *pair))
+
+    @property
+    def size(self):
+        return self.__uncompressed[-1]
+
+    @staticmethod
+    def _inflate(raw):
+        extra_length, = struct.unpack_from('<H', raw, 10)
+        return zlib.decompress(raw[12 + extra_length:-8], -15)
+
+    def _inflate_blocks(self, first, last, pool):
+        with open(self.path, 'rb') as f:
+            f.seek(self.__compressed[first])
+            data = f.read(self.__compressed[last] - self.__compressed[first])
+        base = self.__compressed[first]
+        raws = [data[self.__compressed[b] - base:self.__compressed[b + 1] - base] for b in range(first, last)]
+        # zlib releases the GIL, so blocks inflate concurrently on threads
+        return pool.map(self._inflate, raws)
+
+    def iter_chunks(self, first_block: int = 0):
+        '''
+        :param first_block: block to start from
+        :return: generator of inflated blocks, in file order
+        '''
+        blocks = len(self.__compressed) - 1
+        step = self.threads * 4
+        with ThreadPoolExecutor(self.threads) as pool:
+            for start in range(first_block, blocks, step):
+                yield from self._inflate_blocks(start, min(blocks, start + step), pool)
+
+    def read(self, start: int, end: int):
+        '''
+        :param start: uncompressed offset (inclusive)
+        :param end: uncompressed offset (exclusive)
+        :return: the uncompressed bytes, inflating only the blocks that overlap the range
+        '''
+        if end <= start:
+            return b''
+        first = bisect_right(self.__uncompressed, start) - 1
+        last = bisect_right(self.__uncompressed, end - 1)
+        with ThreadPoolExecutor(self.threads) as pool:
+            data = b''.join(self._inflate_blocks(first, min(last, len(self.__compressed) - 1), pool))
+        skip = start - self.__uncompressed[first]
+        return data[skip:skip + end - start]
@@ -1,11 +1,47 @@
 from abc import ABC, abstractmethod
+import numpy as np
+
+# lookup tables over the uint8 (latin-1) encoding of a sequence
+_UPPER = np.arange(256, dtype=np.uint8)
+_UPPER[ord('a'):ord('z') + 1] -= 32
+_COMPLEMENT = np.arange(256, dtype=np.uint8)
+for _base, _comp in zip(b'ACGTUNRYKMBVDHacgtunrykmbvdh', b'TGCAANYRMKVBHDtgcaanyrmkvbhd'):
+    _COMPLEMENT[_base] = _comp
+_REGULAR = np.zeros(256, dtype=bool)
+_REGULAR[list(b'ATGC')] = True
+
+
+def encode(seq):
+    '''
+    :param seq: sequence as str, bytes or an already encoded array
+    :return: read-only uint8 numpy array with one latin-1 code per base
+    '''
+    if isinstance(seq, np.ndarray):
+        return seq.astype(np.uint8, copy=False)
+    if isinstance(seq, str):
+        try:
+            seq = seq.encode('latin-1')
+        except UnicodeEncodeError as e:
+            raise ValueError(f"Sequence contains a character that is not a single byte: {e.object[e.start:e.end]!r}") from e
+    return np.frombuffer(seq, dtype=np.uint8)
+
+
+def decode(encoded):
+    '''
+    :param encoded: uint8 array produced by encode
+    :return: the sequence as str
+    '''
+    return encoded.tobytes().decode('latin-1')
+
 
 class Sequence(ABC):
+    __slots__ = ()
+
     def __init__(self, df):
         '''
-        :param df: pandas dataframe from Parser output
+        :param df: pandas dataframe from Parser output, only the fields a subclass copies are kept
         '''
-        self.__info = df
+        pass
 
     @property
     @abstractmethod
@@ -18,17 +54,46 @@ class Sequence(ABC):
         pass
 
 class MitochondrialDNA(Sequence):
+    __slots__ = ('__encoded', '__length', '__id', '__name', '__description', '__upper', '__reverse_complement')
+
     def __init__(self, df):
         super().__init__(df)
-        self.__sequence = str(df['seq'])
+        self.__encoded = encode(str(df['seq']))
         self.__length = int(df['length'])
         self.__id = str(df['id'])
         self.__name = str(df['name'])
         self.__description = str(df['description'])
+        self.__upper = None
+        self.__reverse_complement = None
 
     @property
     def sequence(self):
-        return self.__sequence
+        return decode(self.__encoded)
+
+    @property
+    def encoded(self):
+        '''
+        :return: the sequence as a uint8 array, as stored
+        '''
+        return self.__encoded
+
+    @property
+    def encoded_upper(self):
+        '''
+        :return: upper-cased uint8 array, computed once and cached
+        '''
+        if self.__upper is None:
+            self.__upper = _UPPER[self.__encoded]
+        return self.__upper
+
+    @property
+    def reverse_complement(self):
+        '''
+        :return: reverse complement of the upper-cased sequence as a uint8 array, computed once and cached
+        '''
+        if self.__reverse_complement is None:
+            self.__reverse_complement = _COMPLEMENT[self.encoded_upper[::-1]]
+        return self.__reverse_complement
 
     @property
     def length(self):
@@ -36,21 +101,26 @@ class MitochondrialDNA(Sequence):
 
     @property
     def gc_content(self):
-        return ((self.sequence.count('G') + self.sequence.count('C')) / self.length) * 100
+        counts = np.bincount(self.__encoded, minlength=256)
+        return (int(counts[ord('G')] + counts[ord('C')]) / self.length) * 100
 
     def get_subsequence(self, start: int, end: int):
-        if start < 0 or end > len(self.sequence):
+        if start < 0 or end > self.length:
             raise ValueError(f"Subsequence indices out of range: start={start}, end={end}, length={self.length}")
         else:
-            return self.sequence[start:end]
+            return decode(self.__encoded[start:end])
 
     def find_irregular_bases(self):
-        valid_bases = {'A', 'T', 'G', 'C'}
-        irregular = []
-        for base in self.sequence.upper():
-            if base not in valid_bases:
-                irregular.append(base)
-        return irregular
+        upper = self.encoded_upper
+        return list(decode(upper[~_REGULAR[upper]]))
+
+    @property
+    def id(self):
+        return self.__id
+
+    @property
+    def description(self):
+        return self.__description
 
     @property
     def name (self):
@@ -63,4 +133,4 @@ if __name__ == "__main__":
     records = parser.run("synthetic_mtDNA_dataset.fasta")
     NC10 = MitochondrialDNA(records.loc[10])
     print(NC10.gc_content)
-    print(NC10.find_irregular_bases())
\ No newline at end of file
+    print(NC10.find_irregular_bases())
@@ -1,9 +1,15 @@
 from abc import ABC, abstractmethod
+import os
+import gzip
+import hashlib
+import mmap
 import numpy as np
 import pandas as pd
 from Bio import SeqIO
 from collections import Counter
-from sequence import MitochondrialDNA
+from numpy.lib.stride_tricks import sliding_window_view
+from sequence import MitochondrialDNA, encode, decode
+from compression import DECOMPRESSION_ERRORS, compression_type, open_fasta, BgzfReader
 
 class Tool(ABC):
     @abstractmethod
@@ -32,7 +38,7 @@ class Parser (Tool):
 
     def run(self, file_path, return_objects=False):
         '''
-        :param file_path: path to the file to parse
+        :param file_path: path to the file to parse, optionally gzip or BGZF compressed
         :param return_objects: if True, returns a list of MitochondrialDNA objects
         :return: a pandas DataFrame or a list of MitochondrialDNA objects
         '''
@@ -46,7 +52,12 @@ class Parser (Tool):
         self.__data = {}
         self._df = pd.DataFrame()
 
-        self.__records = list(SeqIO.parse(self._file_path, self.format))
+        # gzip and BGZF files are decompressed while SeqIO reads them
+        try:
+            with open_fasta(self._file_path) as handle:
+                self.__records = list(SeqIO.parse(handle, self.format))
+        except DECOMPRESSION_ERRORS as e:
+            raise ValueError(f"Corrupted compressed file {self._file_path}: {e}") from e
 
         if not self.__records:
             raise ValueError(f"No valid records found in file: {self._file_path}")
@@ -85,6 +96,278 @@ class Parser (Tool):
             print(f'{self._df.head()} \n')
 
 
+def _sequence_hash(data=b''):
+    return hashlib.blake2b(data, digest_size=16)
+
+
+def sequence_digest(seq):
+    '''
+    :param seq: sequence as str, bytes or an encoded array
+    :return: the same hash FastaIndex.digest gives for a record with this sequence
+    '''
+    return _sequence_hash(encode(seq).tobytes()).hexdigest()
+
+
+class FastaIndex(Tool):
+    COLUMNS = ['name', 'length', 'offset', 'line_bases', 'line_width']
+
+    def __init__(self):
+        self._file_path = None
+        self._index_path = None
+        self._digest_path = None
+        self._df = pd.DataFrame(columns=self.COLUMNS)
+        self.__entries = {}
+        self.__compression = None
+        self.__bgzf = None
+        self.__digests = {}
+        self.__stamp = None
+        self.__inflated = None
+
+    def run(self, file_path, rebuild=False):
+        '''Loads the samtools faidx-compatible index stored next to the file, building it if
+        it is missing or older than the file. Sequence hashes are stored beside it in <file>.digests.
+        :param file_path: path to a FASTA file, plain, gzip or BGZF compressed
+        :param rebuild: if True, always rebuild the index
+        :return: a pandas DataFrame with one row per record (name, length, offset, line_bases, line_width)
+        '''
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        self._file_path = file_path
+        self._index_path = file_path + '.fai'
+        self._digest_path = file_path + '.digests'
+        # offsets in the index refer to the uncompressed stream
+        self.__compression = compression_type(file_path)
+        self.__bgzf = BgzfReader(file_path) if self.__compression == 'bgzf' else None
+        self.__inflated = None
+        self.__digests = {}
+        # offsets are only valid for the file as it is now
+        self.__stamp = self._file_stamp()
+
+        if rebuild or self._is_stale(self._index_path):
+            try:
+                rows = self._build()
+            except DECOMPRESSION_ERRORS as e:
+                raise ValueError(f"Corrupted compressed file {self._file_path}: {e}") from e
+            with open(self._index_path, 'w') as f:
+                for row in rows:
+                    f.write('\t'.join(map(str, row)) + '\n')
+            # sequence hashes taken during the build are kept next to the index
+            with open(self._digest_path, 'w') as f:
+                for name, digest in self.__digests.items():
+                    f.write(f'{name}\t{digest}\n')
+        else:
+            with open(self._index_path) as f:
+                rows = [line.rstrip('\n').split('\t') for line in f if line.strip()]
+            rows = [(r[0], *map(int, r[1:5])) for r in rows]
+            if not self._is_stale(self._digest_path):
+                with open(self._digest_path) as f:
+                    self.__digests = dict(line.rstrip('\n').split('\t') for line in f if line.strip())
+        if self.__bgzf is not None and self._is_stale(self.__bgzf.index_path):
+            # lets the next BgzfReader skip the block scan
+            self.__bgzf.write_index()
+
+        if not rows:
+            raise ValueError(f"No valid records found in file: {self._file_path}")
+        self.__entries = {row[0]: row[1:] for row in rows}
+        self._df = pd.DataFrame(rows, columns=self.COLUMNS)
+        return self._df
+
+    def _is_stale(self, path):
+        return not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(self._file_path)
+
+    def _build(self):
+        '''
+        Streams the file once, recording where each record's sequence starts and its line layout.
+        :return: list of (name, length, offset, line_bases, line_width) tuples
+        '''
+        rows, seen = [], set()
+        record = None
+        offset = 0
+
+        def finish(rec):
+            if rec is not None:
+                rows.append((rec['name'], rec['length'], rec['offset'], rec['line_bases'], rec['line_width']))
+                self.__digests[rec['name']] = rec['hash'].hexdigest()
+
+        with open_fasta(self._file_path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'>'):
+                    finish(record)
+                    fields = line[1:].split(None, 1)
+                    name = fields[0].decode() if fields else ''
+                    if name in seen:
+                        raise ValueError(f"Duplicate record name in {self._file_path}: {name}")
+                    seen.add(name)
+                    record = {'name': name, 'length': 0, 'offset': offset + len(line),
+                              'line_bases': 0, 'line_width': 0, 'short_line': False, 'hash': _sequence_hash()}
+                elif record is not None:
+                    content = line.rstrip(b'\r\n')
+                    bases = len(content)
+                    # offsets assume one byte per base, as Parser reads the same file
+                    if bases and (content.split() != [content] or not content.isascii()):
+                        raise ValueError(f"Whitespace or non-ASCII bytes in record {record['name']} of {self._file_path}")
+                    if bases:
+                        # only the last line of a record may be shorter than the others
+                        if record['short_line'] or (record['line_bases'] and bases > record['line_bases']):
+                            raise ValueError(f"Different line length in record {record['name']} of {self._file_path}")
+                        if not record['line_bases']:
+                            # blank lines between the header and the sequence are skipped
+                            record['offset'] = offset
+                            record['line_bases'], record['line_width'] = bases, len(line)
+                        elif bases < record['line_bases'] or len(line) != record['line_width']:
+                            record['short_line'] = True
+                        record['length'] += bases
+                        record['hash'].update(line[:bases])
+                    elif record['line_bases']:
+                        record['short_line'] = True
+                offset += len(line)
+        finish(record)
+        return rows
+
+    @property
+    def names(self):
+        return list(self.__entries)
+
+    @property
+    def random_access(self):
+        '''
+        :return: False for plain gzip, which is inflated whole on the first read
+        '''
+        return self.__compression != 'gzip'
+
+    def close(self):
+        '''
+        Releases the inflated copy of a plain gzip file; a later read inflates it again.
+        '''
+        self.__inflated = None
+
+    def length(self, name: str):
+        return self._entry(name)[0]
+
+    def digest(self, name: str):
+        '''
+        :param name: record name
+        :return: hash of the record's sequence, taken while building the index (and stored in
+            <file>.digests) or read on first use
+        '''
+        if name not in self.__digests:
+            length, offset, _, _ = self._entry(name)
+            seq = self._read_range(offset, self._position(name, length - 1) + 1) if length else b''
+            self.__digests[name] = _sequence_hash(seq.translate(None, b'\r\n')).hexdigest()
+        return self.__digests[name]
+
+    def _entry(self, name):
+        if name not in self.__entries:
+            raise KeyError(f"Record not found in index: {name}")
+        return self.__entries[name]
+
+    def _position(self, name, base):
+        '''
+        :return: byte offset of the given 0-based base inside the record
+        '''
+        _, offset, line_bases, line_width = self._entry(name)
+        if not line_bases:
+            return offset
+        return offset + (base // line_bases) * line_width + base % line_bases
+
+    def get_subsequence(self, name: str, start: int, end: int):
+        '''
+        Reads only the bytes covering [start, end) of one record (mmap, or the overlapping BGZF blocks;
+        a plain gzip file is inflated whole on first use).
+        :param name: record name
+        :param start: 0-based start (inclusive)
+        :param end: 0-based end (exclusive)
+        :return: the subsequence as str
+        '''
+        length = self.length(name)
+        if start < 0 or end > length:
+            raise ValueError(f"Subsequence indices out of range: start={start}, end={end}, length={length}")
+        if end <= start:
+            return ''
+        first, last = self._position(name, start), self._position(name, end - 1) + 1
+        return self._read_range(first, last).translate(None, b'\r\n').decode('latin-1')
+
+    def _file_stamp(self):
+        stat = os.stat(self._file_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _read_range(self, first, last):
+        '''
+        :return: uncompressed bytes [first, last) of the file
+        '''
+        if self._file_stamp() != self.__stamp:
+            raise ValueError(f"File changed since it was indexed: {self._file_path}")
+        if self.__compression == 'bgzf':
+            return self.__bgzf.read(first, last)
+        if self.__compression == 'gzip':
+            # plain gzip has no block boundaries to seek to, so it is inflated once and kept
+            if self.__inflated is None:
+                with gzip.open(self._file_path, 'rb') as f:
+                    self.__inflated = f.read()
+            return self.__inflated[first:last]
+        with open(self._file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[first:last]
+
+    def _read_header(self, offset):
+        '''
+        :param offset: where a record's sequence starts
+        :return: the header line of that record, without '>'
+        '''
+        window = 256
+        while True:
+            first = max(0, offset - window)
+            chunk = self._read_range(first, offset)
+            # the header is the last line starting with '>' before the sequence
+            start = chunk.rfind(b'\n>') + 1
+            if start or first == 0:
+                return chunk[start + 1:].split(b'\n', 1)[0].rstrip().decode(errors='replace')
+            window *= 4
+
+    def fetch(self, name: str):
+        '''
+        :param name: record name
+        :return: the record as a MitochondrialDNA object
+        '''
+        length, offset, _, _ = self._entry(name)
+        description = self._read_header(offset)
+        seq = self._read_range(offset, self._position(name, length - 1) + 1) if length else b''
+        seq = seq.translate(None, b'\r\n').decode('latin-1')
+        return MitochondrialDNA({'seq': seq, 'length': length, 'id': name, 'name': name, 'description': description})
+
+    def report(self):
+        if not self.__entries:
+            print("No index has been loaded.")
+            return
+        print(f'Index {self._index_path}: {len(self.__entries)} records')
+        print(f'{self._df.head()} \n')
+
+
+def exact_match_is_optimal(scoring, method='global'):
+    '''
+    :param scoring: object with match, mismatch and gap scores
+    :param method: global or local alignment
+    :return: True if pairing equal bases is always optimal and wins the traceback's ties, which
+        holds when a match is worth at least a mismatch and at least two gaps (and is positive
+        for local alignment). Identical pairs and shared suffixes can then skip the DP.
+    '''
+    if scoring.match < scoring.mismatch or scoring.match < 2 * scoring.gap:
+        return False
+    return method == 'global' or scoring.match > 0
+
+
+def common_suffix(seq1, seq2):
+    '''
+    :param seq1: encoded sequence
+    :param seq2: encoded sequence
+    :return: length of the longest common suffix
+    '''
+    size = min(len(seq1), len(seq2))
+    if size == 0:
+        return 0
+    differ = np.flatnonzero(seq1[len(seq1) - size:][::-1] != seq2[len(seq2) - size:][::-1])
+    return int(differ[0]) if len(differ) else size
+
+
 class SequenceAligner(Tool):
     def __init__(self, match=2, mismatch=-1, gap=-2, show_matrix: bool = False):
         '''
@@ -101,21 +384,69 @@ class SequenceAligner(Tool):
 
     def run(self, seq1, seq2, method='global'):
         '''
-        :param seq1: sequence to align
-        :param seq2: sequence to align
+        :param seq1: sequence to align, str or encoded uint8 array
+        :param seq2: sequence to align, str or encoded uint8 array
         :param method: global or local alignment, default is global
         '''
-        if method == 'global':
+        seq1, seq2 = encode(seq1), encode(seq2)
+        if method not in ('global', 'local'):
+            raise ValueError("Invalid method. Use 'global' or 'local'.")
+        if not self.show_matrix and exact_match_is_optimal(self, method) and np.array_equal(seq1, seq2):
+            self.result = self._identical_result(seq1, method)
+        elif method == 'global':
             self._global_align(seq1, seq2)
-        elif method == 'local':
-            self._local_align(seq1, seq2)
         else:
-            raise ValueError("Invalid method. Use 'global' or 'local'.")
+            self._local_align(seq1, seq2)
+
+    def _identical_result(self, seq, method):
+        '''
+        :param seq: encoded sequence aligned against itself
+        :param method: global or local alignment
+        :return: the result the DP would produce, without filling the matrix
+        '''
+        bases = [chr(c) for c in seq]
+        return {
+            "type": method,
+            "score": np.int_(len(seq) * self.match),
+            "aligned_seq1": bases,
+            "aligned_seq2": list(bases),
+            "matches": ['|'] * len(seq),
+            "match_count": len(seq),
+            "mismatch_count": 0,
+            "gap_count": 0
+        }
 
     def _print_matrix(self, matrix):
         for row in matrix:
             print("\t".join(str(cell) for cell in row))
 
+    def _fill_matrix(self, seq1, seq2, local=False):
+        '''Fills the score matrix one row at a time.
+        :param seq1: encoded sequence (rows)
+        :param seq2: encoded sequence (columns)
+        :param local: clamp cells at 0 for local alignment
+        With a linear gap, H[i][j] = max(c[j], H[i][j - 1] + gap) where c holds the diagonal and
+        vertical moves, which unrolls to j * gap + prefix-max of (c[k] - k * gap). The row is
+        therefore a single maximum.accumulate instead of a Python loop over the columns.
+        '''
+        rows, cols = len(seq1) + 1, len(seq2) + 1
+        score_matrix = np.zeros((rows, cols), dtype=int)
+        offsets = np.arange(cols) * self.gap
+        if not local:
+            score_matrix[:, 0] = np.arange(0, rows) * self.gap
+            score_matrix[0, :] = offsets
+
+        for i in range(1, rows):
+            prev = score_matrix[i - 1]
+            substitution = np.where(seq2 == seq1[i - 1], self.match, self.mismatch)
+            best = np.empty(cols, dtype=int)
+            best[0] = score_matrix[i, 0]
+            best[1:] = np.maximum(prev[:-1] + substitution, prev[1:] + self.gap)
+            if local:
+                np.maximum(best, 0, out=best)
+            score_matrix[i] = np.maximum.accumulate(best - offsets) + offsets
+        return score_matrix
+
     def _global_align(self, seq1, seq2):
         '''
         :param seq1: sequence to align
@@ -131,28 +462,25 @@ class SequenceAligner(Tool):
             - 'mismatch_count': Number of mismatches
             - 'gap_count': Number of gaps introduced in either sequence
         '''
-        rows, cols = len(seq1) + 1, len(seq2) + 1
-        score_matrix = np.zeros((rows, cols), dtype=int)
-
-        score_matrix[:, 0] = np.arange(0, rows) * self.gap
-        score_matrix[0, :] = np.arange(0, cols) * self.gap
-
-        for i in range(1, rows):
-            for j in range(1, cols):
-                match_score = score_matrix[i - 1][j - 1] + (self.match if seq1[i - 1] == seq2[j - 1] else self.mismatch)
-                del_score = score_matrix[i - 1][j] + self.gap
-                ins_score = score_matrix[i][j - 1] + self.gap
-                score_matrix[i][j] = max(match_score, del_score, ins_score)
+        # the traceback walks a shared suffix diagonally, so only the part before it needs the DP
+        suffix = 0 if self.show_matrix or not exact_match_is_optimal(self, 'global') else common_suffix(seq1, seq2)
+        core1, core2 = seq1[:len(seq1) - suffix], seq2[:len(seq2) - suffix]
+        score_matrix = self._fill_matrix(core1, core2, local=False)
 
         if self.show_matrix:
             print("Global Alignment Score Matrix:")
             self._print_matrix(score_matrix)
 
-        aligned_seq1, aligned_seq2, matches, match_count, mismatch_count, gap_count = self._traceback(seq1, seq2, score_matrix, method="global")
+        aligned_seq1, aligned_seq2, matches, match_count, mismatch_count, gap_count = self._traceback(core1, core2, score_matrix, method="global")
+        tail = [chr(c) for c in seq1[len(core1):]]
+        aligned_seq1 += tail
+        aligned_seq2 += tail
+        matches += ['|'] * suffix
+        match_count += suffix
 
         self.result = {
             "type": "global",
-            "score": score_matrix[-1][-1],
+            "score": score_matrix[-1][-1] + suffix * self.match,
             "aligned_seq1": aligned_seq1,
             "aligned_seq2": aligned_seq2,
             "matches": matches,
@@ -176,21 +504,11 @@ class SequenceAligner(Tool):
             - 'mismatch_count': Number of mismatches
             - 'gap_count': Number of gaps introduced in either sequence
         '''
-        rows, cols = len(seq1) + 1, len(seq2) + 1
-        score_matrix = np.zeros((rows, cols), dtype=int)
-
-        max_score, max_pos = 0, (0, 0)
-
-        for i in range(1, rows):
-            for j in range(1, cols):
-                match_score = score_matrix[i - 1][j - 1] + (self.match if seq1[i - 1] == seq2[j - 1] else self.mismatch)
-                del_score = score_matrix[i - 1][j] + self.gap
-                ins_score = score_matrix[i][j - 1] + self.gap
-                score_matrix[i][j] = max(0, match_score, del_score, ins_score)
+        score_matrix = self._fill_matrix(seq1, seq2, local=True)
 
-                if score_matrix[i][j] > max_score:
-                    max_score = score_matrix[i][j]
-                    max_pos = (i, j)
+        # argmax returns the first maximum in row-major order, (0, 0) if every cell is 0
+        max_pos = np.unravel_index(np.argmax(score_matrix), score_matrix.shape)
+        max_score = score_matrix[max_pos]
 
         if self.show_matrix:
             print("Local Alignment Score Matrix:")
@@ -231,8 +549,8 @@ class SequenceAligner(Tool):
             left = score_matrix[i - 1][j]
 
             if current == diag + (self.match if seq1[i - 1] == seq2[j - 1] else self.mismatch):
-                aligned_seq1.append(seq1[i - 1])
-                aligned_seq2.append(seq2[j - 1])
+                aligned_seq1.append(chr(seq1[i - 1]))
+                aligned_seq2.append(chr(seq2[j - 1]))
                 if seq1[i - 1] == seq2[j - 1]:
                     matches.append('|')
                     match_count += 1  # Increment match count
@@ -243,26 +561,26 @@ class SequenceAligner(Tool):
                 j -= 1
             elif current == up + self.gap:
                 aligned_seq1.append('-')
-                aligned_seq2.append(seq2[j - 1])
+                aligned_seq2.append(chr(seq2[j - 1]))
                 matches.append(' ')
                 gap_count += 1  # Increment gap count
                 j -= 1
             else:  # left
-                aligned_seq1.append(seq1[i - 1])
+                aligned_seq1.append(chr(seq1[i - 1]))
                 aligned_seq2.append('-')
                 matches.append(' ')
                 gap_count += 1  # Increment gap count
                 i -= 1
 
         while i > 0:
-            aligned_seq1.append(seq1[i - 1])
+            aligned_seq1.append(chr(seq1[i - 1]))
             aligned_seq2.append('-')
             matches.append(' ')
             gap_count += 1  # Increment gap count
             i -= 1
         while j > 0:
             aligned_seq1.append('-')
-            aligned_seq2.append(seq2[j - 1])
+            aligned_seq2.append(chr(seq2[j - 1]))
             matches.append(' ')
             gap_count += 1  # Increment gap count
             j -= 1
@@ -308,6 +626,197 @@ class SequenceAligner(Tool):
         return self.result
 
 
+class BatchAligner(Tool):
+    def __init__(self, match=2, mismatch=-1, gap=-2, batch_size: int = 32):
+        '''
+        :param match: score for match
+        :param mismatch: score for mismatch
+        :param gap: score for gap
+        :param batch_size: number of target sequences advanced through the DP together
+        '''
+        self.match = match
+        self.mismatch = mismatch
+        self.gap = gap
+        self.batch_size = batch_size
+        self.result = []
+
+    def run(self, reference, targets, method='global'):
+        '''Scores the reference against every target without building a traceback.
+        The targets are padded into a uint8 matrix and the DP is filled one reference row at a
+        time for the whole batch, each row as a prefix maximum, so each numpy operation covers
+        every pair at once.
+        Scores and counts are identical to the ones SequenceAligner reports.
+        :param reference: reference sequence
+        :param targets: list of sequences to score against the reference
+        :param method: global or local alignment, default is global
+        :return: list of dicts with 'score', 'match_count', 'mismatch_count', 'gap_count'
+        '''
+        if method not in ('global', 'local'):
+            raise ValueError("Invalid method. Use 'global' or 'local'.")
+
+        ref = encode(reference)
+        targets = [encode(t) for t in targets]
+        # every distinct target is scored once, and a copy of the reference needs no DP at all
+        distinct = {}
+        for t in targets:
+            distinct.setdefault(t.tobytes(), t)
+        scored = {}
+        if exact_match_is_optimal(self, method) and ref.tobytes() in distinct:
+            scored[ref.tobytes()] = {
+                "type": method,
+                "score": len(ref) * self.match,
+                "match_count": len(ref),
+                "mismatch_count": 0,
+                "gap_count": 0,
+            }
+        pending = [key for key in distinct if key not in scored]
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            scored.update(zip(chunk, self._score_batch(ref, [distinct[key] for key in chunk], method)))
+        self.result = [dict(scored[t.tobytes()]) for t in targets]
+        return self.result
+
+    def _score_batch(self, ref, targets, method):
+        '''
+        :param ref: encoded reference (rows of the DP matrix)
+        :param targets: list of encoded targets (columns of the DP matrix)
+        :param method: global or local alignment
+        Each row is filled for the whole batch with the prefix-max recurrence of
+        SequenceAligner._fill_matrix, kept shifted as g[j] = H[j] - j * gap so that the row is a
+        plain maximum.accumulate. Predecessors are chosen in the same order as
+        SequenceAligner._traceback (diagonal, then up, then left), and a run of "up" moves
+        inherits the counts of the cell it started from, which keeps the counts equal.
+        Matches and mismatches are packed into one integer below the column index; the prefix max
+        of the packed values then picks the cell each run started from, and the gaps follow
+        from the counts, since a path ending at (i, j) consumes i + j bases.
+        '''
+        local = method == 'local'
+        n, batch = len(ref), len(targets)
+        lengths = np.array([len(t) for t in targets], dtype=np.int64)
+        m = int(lengths.max()) if batch else 0
+
+        # bit layout of the packed counts: column | matches | mismatches
+        width = max(n, m).bit_length()
+        bits = 2 * width + (m + 1).bit_length()
+        if bits > 63:
+            raise ValueError("Sequences are too long to be scored in a batch.")
+        count_type = np.int32 if bits <= 31 else np.int64
+        count_mask = (1 << 2 * width) - 1
+
+        # 0 never matches an encoded base, so padding only affects cells past each target's end
+        padded = np.zeros((batch, m), dtype=np.uint8)
+        for b, t in enumerate(targets):
+            padded[b, :len(t)] = t
+
+        # the rows are memory bound, so the narrowest type that holds every shifted score is used
+        dtype = np.result_type(np.int64, self.match, self.mismatch, self.gap)
+        bound = (n + m + 1) * (abs(self.match) + abs(self.mismatch) + 2 * abs(self.gap))
+        if dtype == np.int64 and bound < 2 ** 30:
+            dtype = np.int32
+        cols = np.arange(m + 1, dtype=np.int64)
+        offsets = (cols * self.gap).astype(dtype)
+        col_tags = (cols[1:] << 2 * width).astype(count_type)
+
+        # shifted substitution scores and count increments per distinct reference base
+        substitution, increment = {}, {}
+        for base in np.unique(ref):
+            same = padded == base
+            substitution[base] = np.where(same, self.match - self.gap, self.mismatch - self.gap).astype(dtype)
+            increment[base] = np.where(same, 1 << width, 1).astype(count_type)
+
+        g = np.tile(-offsets, (batch, 1)) if local else np.zeros((batch, m + 1), dtype=dtype)
+        counts = np.zeros((batch, m + 1), dtype=count_type)
+        start = np.empty_like(g)
+        diag = np.empty((batch, m), dtype=dtype)
+        take_diag = np.empty((batch, m), dtype=bool)
+        run = np.empty((batch, m), dtype=bool)
+        packed = np.zeros((batch, m + 1), dtype=count_type)
+
+        if local:
+            rows = np.arange(batch)
+            # cells past a target's end can never be its best cell
+            inside = np.where(cols[1:] > lengths[:, None], -bound, offsets[1:]).astype(dtype)
+            cand = np.empty((batch, m), dtype=dtype)
+            zero = np.empty((batch, m), dtype=bool)
+            best_score = np.zeros(batch, dtype=dtype)
+            best_counts = np.zeros(batch, dtype=count_type)
+            best_cell = np.zeros(batch, dtype=np.int64)
+
+        for i in range(1, n + 1):
+            base = ref[i - 1]
+            np.add(g[:, :-1], substitution[base], out=diag)
+            start[:, 0] = 0 if local else i * self.gap
+            np.add(g[:, 1:], self.gap, out=start[:, 1:])
+            np.maximum(start[:, 1:], diag, out=start[:, 1:])
+            if local:
+                # H >= 0 is g >= -j * gap
+                np.maximum(start, -offsets, out=start)
+            np.maximum.accumulate(start, axis=1, out=g)
+
+            body = g[:, 1:]
+            np.equal(body, diag, out=take_diag)
+            # "up" is H[j] == H[j - 1] + gap, which is g[j] == g[j - 1]; diagonal wins ties
+            np.equal(body, g[:, :-1], out=run)
+            np.greater(run, take_diag, out=run)
+
+            # counts of cells that do not continue a horizontal run, tagged with their column;
+            # blended with arithmetic since masked copies are slow on irregular masks
+            fresh = packed[:, 1:]
+            np.subtract(counts[:, :-1], counts[:, 1:], out=fresh)
+            fresh += increment[base]
+            fresh *= take_diag
+            fresh += counts[:, 1:]
+            if local:
+                # the traceback stops on a zero cell and pads the remaining prefix with gaps
+                np.equal(body, -offsets[1:], out=zero)
+                fresh *= ~zero
+                np.greater(run, zero, out=run)
+            fresh |= col_tags
+            fresh *= ~run
+
+            # a run of "up" moves starts from the last cell that was not one
+            np.maximum.accumulate(packed, axis=1, out=counts)
+            counts &= count_mask
+
+            if local and m:
+                # only cells inside each target, first maximum in row-major order wins
+                np.add(body, inside, out=cand)
+                pos = cand.argmax(axis=1)
+                better = cand[rows, pos] > best_score
+                if better.any():
+                    best_score[better] = cand[better, pos[better]]
+                    best_counts[better] = counts[better, pos[better] + 1]
+                    best_cell[better] = i + pos[better] + 1
+
+        if local:
+            score, packed, consumed = best_score, best_counts, best_cell
+        else:
+            ends = (np.arange(batch), lengths)
+            score, packed, consumed = g[ends] + offsets[lengths], counts[ends], n + lengths
+        matches, mismatches = packed >> width, packed & ((1 << width) - 1)
+        gaps = consumed - 2 * (matches + mismatches)
+        return [
+            {
+                "type": method,
+                "score": int(score[b]),
+                "match_count": int(matches[b]),
+                "mismatch_count": int(mismatches[b]),
+                "gap_count": int(gaps[b]),
+            }
+            for b in range(batch)
+        ]
+
+    def report(self):
+        if not self.result:
+            print("No batch alignment has been run.")
+            return
+        print(f"Batch {self.result[0]['type']} alignment of {len(self.result)} sequences:")
+        for i, data in enumerate(self.result):
+            print(f"\tTarget {i}: score {data['score']}, matches {data['match_count']}, "
+                  f"mismatches {data['mismatch_count']}, gaps {data['gap_count']}")
+        print()
+
+
 from typing import List
 from sequence import MitochondrialDNA
 
@@ -339,8 +848,13 @@ class MotifFinder(Tool):
 
     def _find_specific_motif_across_sequences(self, sequences: List[MitochondrialDNA], motif: str):
         results = []
+        try:
+            encoded_motif = encode(motif.upper())
+        except ValueError:
+            # a character no sequence byte can hold matches nowhere
+            return results
         for i, seq_obj in enumerate(sequences):
-            positions = self._find_motif_occurrences(seq_obj.sequence.upper(), motif.upper())
+            positions = self._find_motif_occurrences(seq_obj.encoded_upper, encoded_motif)
             if positions:
                 results.append({
                     'sequence_index': i,
@@ -351,29 +865,36 @@ class MotifFinder(Tool):
                 })
         return results
 
-    def _find_motif_occurrences(self, sequence: str, motif: str):
-        positions = []
+    def _find_motif_occurrences(self, sequence: np.ndarray, motif: np.ndarray):
+        '''
+        :param sequence: encoded sequence
+        :param motif: encoded motif
+        :return: list of (possibly overlapping) start positions
+        '''
         motif_len = len(motif)
-        for i in range(len(sequence) - motif_len + 1):
-            if sequence[i:i + motif_len] == motif:
-                positions.append(i)
-        return positions
+        if motif_len == 0 or motif_len > len(sequence):
+            return []
+        windows = sliding_window_view(sequence, motif_len)
+        return np.flatnonzero((windows == motif).all(axis=1)).tolist()
 
     def _discover_conserved_motifs(self, sequences: List[MitochondrialDNA], k: int, threshold: int):
         motif_occurrences_details = {}
         for seq_idx, seq_obj in enumerate(sequences):
-            kmer_counts = Counter()
-            sequence = seq_obj.sequence.upper()
-            for i in range(len(sequence) - k + 1):
-                kmer = sequence[i:i + k]
-                kmer_counts[kmer] += 1
-    
-            found_motifs_in_seq = {motif: count for motif, count in kmer_counts.items() if count >= 1}
-    
-            for motif in found_motifs_in_seq:
+            sequence = seq_obj.encoded_upper
+            if k < 1 or len(sequence) < k:
+                continue
+            # every k-mer as one fixed-size void item, so np.unique groups them in a single pass
+            kmers = np.ascontiguousarray(sliding_window_view(sequence, k)).view(np.dtype((np.void, k))).ravel()
+            unique, first, inverse = np.unique(kmers, return_index=True, return_inverse=True)
+            starts = np.argsort(inverse, kind='stable')
+            groups = np.split(starts, np.cumsum(np.bincount(inverse))[:-1])
+
+            # keep the k-mers in order of first appearance
+            for g in np.argsort(first):
+                motif = decode(unique[g])
                 if motif not in motif_occurrences_details:
                     motif_occurrences_details[motif] = {}
-                motif_occurrences_details[motif][seq_idx] = self._find_motif_occurrences(sequence, motif)
+                motif_occurrences_details[motif][seq_idx] = groups[g].tolist()
     
     
         conserved_motifs = []
@@ -419,3 +940,263 @@ class MotifFinder(Tool):
                 print(f"\t\tCount: {result['count']}")
                 print(f"\t\tPositions: {', '.join(map(str, result['positions']))}")
             print()
+
+
+class VariantCaller(Tool):
+    ALLELES = 'ACGTN-'
+    GAP = ord('-')
+
+    def __init__(self):
+        self.result = {}
+        self.__panel = None
+        self.__insertions = []
+        self.__called = {}
+
+    def run(self, reference: str, alignments: List[dict], sample_names: List[str] = None):
+        '''Turns reference-vs-sample alignments into variant calls in reference coordinates.
+        :param reference: the reference sequence
+        :param alignments: global alignment dicts from SequenceAligner, reference as seq1
+        :param sample_names: one name per alignment, defaults to sample_<i>
+        :return: dict containing:
+            - 'samples': the sample names
+            - 'calls': DataFrame of SNV/INS/DEL calls (sample, pos, ref, alt, type), 1-based VCF positions
+            - 'frequencies': DataFrame with allele counts and alt frequency per reference position
+            - 'consensus': majority consensus sequence of the panel
+        '''
+        if sample_names is None:
+            sample_names = [f'sample_{i}' for i in range(len(alignments))]
+        if len(sample_names) != len(alignments):
+            raise ValueError("Expected one sample name per alignment.")
+        for data in alignments:
+            if data.get('type') != 'global':
+                raise ValueError("Variant calling needs global alignments.")
+
+        reference = reference.upper()
+        ref = encode(reference)
+        # base carried by every sample at every reference position, '-' where it is deleted
+        panel = np.full((len(alignments), len(ref)), self.GAP, dtype=np.uint8)
+        calls, insertions = [], []
+        # per sample inserted bases by anchor, and the call types of each sample per position
+        self.__insertions, self.__called = [], {}
+
+        for b, (name, data) in enumerate(zip(sample_names, alignments)):
+            ref_cols = encode(''.join(data['aligned_seq1']).upper())
+            sample_cols = encode(''.join(data['aligned_seq2']).upper())
+            if np.count_nonzero(ref_cols != self.GAP) != len(ref):
+                raise ValueError(f"Alignment {b} does not cover the reference.")
+            sample_calls, sample_insertions = self._call_sample(reference, ref_cols, sample_cols, panel[b])
+            calls.extend((name, *call) for call in sample_calls)
+            insertions.extend(sample_insertions)
+            self.__insertions.append(dict(sample_insertions))
+            for pos, _, _, kind in sample_calls:
+                self.__called.setdefault(pos, {}).setdefault(b, set()).add(kind)
+        self.__panel = panel
+
+        calls = pd.DataFrame(calls, columns=['sample', 'pos', 'ref', 'alt', 'type'])
+        calls = calls.sort_values(['pos', 'type', 'sample'], kind='stable').reset_index(drop=True)
+        # allele counts per position in ALLELES order, anything that is not ACGT or a gap counts as N
+        counts = np.stack([(panel == ord(a)).sum(axis=0) for a in 'ACGT-'])
+        counts = np.insert(counts, 4, len(alignments) - counts.sum(axis=0), axis=0)
+        ref_allele = np.array([self.ALLELES.index(c) if c in 'ACGT' else 4 for c in reference], dtype=np.int64)
+        ref_counts = counts[ref_allele, np.arange(len(ref))]
+
+        self.result = {
+            'samples': list(sample_names),
+            'calls': calls,
+            'frequencies': self._frequencies(reference, counts, ref_counts, insertions, len(alignments)),
+            'consensus': self._consensus(reference, counts, ref_allele, ref_counts, insertions, len(alignments)),
+        }
+        return self.result
+
+    def _call_sample(self, reference, ref_cols, sample_cols, bases):
+        '''
+        :param reference: upper-cased reference
+        :param ref_cols: encoded alignment row of the reference
+        :param sample_cols: encoded alignment row of the sample
+        :param bases: panel row to fill with the sample base at each reference position
+        :return: list of (pos, ref, alt, type) calls and list of (anchor, inserted) insertions
+        '''
+        is_ref = ref_cols != self.GAP
+        is_gap = sample_cols == self.GAP
+        # reference coordinate of each column; insertion columns get the base before them (-1 at the start)
+        ref_pos = np.cumsum(is_ref) - 1
+        bases[ref_pos[is_ref]] = sample_cols[is_ref]
+
+        calls = []
+        for col in np.flatnonzero(is_ref & ~is_gap & (ref_cols != sample_cols)):
+            p = int(ref_pos[col])
+            calls.append((p + 1, reference[p], chr(sample_cols[col]), 'SNV'))
+
+        # VCF anchors indels on the preceding base, or on the following one at the start
+        for start, end in self._runs(is_ref & is_gap):
+            first, last = int(ref_pos[start]), int(ref_pos[end - 1])
+            deleted = reference[first:last + 1]
+            if first > 0:
+                calls.append((first, reference[first - 1] + deleted, reference[first - 1], 'DEL'))
+            elif last + 1 < len(reference):
+                calls.append((1, deleted + reference[last + 1], reference[last + 1], 'DEL'))
+            else:
+                # no reference base is left to anchor on, so the symbolic allele is used
+                calls.append((1, deleted, '<DEL>', 'DEL'))
+
+        insertions = []
+        for start, end in self._runs(~is_ref):
+            anchor = int(ref_pos[start])
+            inserted = decode(sample_cols[start:end])
+            insertions.append((anchor, inserted))
+            if anchor >= 0:
+                calls.append((anchor + 1, reference[anchor], reference[anchor] + inserted, 'INS'))
+            elif reference:
+                calls.append((1, reference[0], inserted + reference[0], 'INS'))
+        return calls, insertions
+
+    @staticmethod
+    def _runs(mask):
+        '''
+        :return: (start, end) pairs of the consecutive True stretches in mask
+        '''
+        edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+        return zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+
+    def _frequencies(self, reference, counts, ref_counts, insertions, samples):
+        # insertions are counted at the position their VCF record is anchored on
+        inserted = np.zeros(len(reference), dtype=np.int64)
+        for anchor, _ in insertions:
+            if reference:
+                inserted[max(anchor, 0)] += 1
+
+        table = pd.DataFrame({'pos': np.arange(1, len(reference) + 1), 'ref': list(reference)})
+        for allele, row in zip(self.ALLELES, counts):
+            table[allele] = row
+        table['INS'] = inserted
+        table['depth'] = samples
+        table['alt_freq'] = (samples - ref_counts) / samples if samples else 0.0
+        return table
+
+    def _consensus(self, reference, counts, ref_allele, ref_counts, insertions, samples):
+        # majority allele per position, the reference base wins ties
+        winner = np.where(ref_counts == counts.max(axis=0), ref_allele, counts.argmax(axis=0))
+        columns = [reference[p] if w == ref_allele[p] else self.ALLELES[w] for p, w in enumerate(winner)]
+
+        # an insertion is kept when more than half of the panel carries the same inserted bases
+        by_anchor = {}
+        for anchor, inserted in insertions:
+            by_anchor.setdefault(anchor, Counter())[inserted] += 1
+        prefix = ''
+        for anchor, seen in by_anchor.items():
+            inserted, count = seen.most_common(1)[0]
+            if count * 2 > samples:
+                if anchor < 0:
+                    prefix = inserted
+                else:
+                    columns[anchor] = columns[anchor].replace('-', '') + inserted
+        return prefix + ''.join(c for c in columns if c != '-')
+
+    def get_result(self):
+        if not self.result:
+            raise ValueError("No variant calling has been run.")
+        return self.result
+
+    def save_to_tsv(self, output_path, table: str = 'calls'):
+        '''
+        :param output_path: path of the TSV file
+        :param table: 'calls' or 'frequencies'
+        '''
+        try:
+            self.get_result()[table].to_csv(output_path, sep='\t', index=False)
+            print(f"Successfully saved {table} to {output_path} \n")
+        except Exception as e:
+            print(f"Error saving TSV file: {str(e)}, run variant calling first \n")
+
+    def _allele(self, sample, start, end):
+        '''
+        :param sample: sample index
+        :param start: 0-based first reference position of the record
+        :param end: end (exclusive) of the record's REF
+        :return: the bases the sample carries over [start, end), with the insertions that fall
+            inside the span (and the ones after the first base, where VCF anchors them)
+        '''
+        inserted = self.__insertions[sample]
+        parts = [inserted.get(-1, '')] if start == 0 else []
+        for p in range(start, end):
+            if self.__panel[sample, p] != self.GAP:
+                parts.append(chr(self.__panel[sample, p]))
+            if p == start or p < end - 1:
+                parts.append(inserted.get(p, ''))
+        return ''.join(parts) or '<DEL>'
+
+    def to_vcf(self, contig: str = 'reference', reference_length: int = None):
+        '''
+        :param contig: name of the reference in the CHROM column
+        :param reference_length: length written to the contig header line
+        :return: haploid multi-sample VCF text, one multi-allelic line per variant position.
+            REF spans the longest reference allele called there and each ALT is a sample's
+            bases over that span; samples deleting the position through an upstream deletion
+            carry '*', and samples matching neither REF nor an ALT get '.'.
+        '''
+        calls = self.get_result()['calls']
+        samples = self.result['samples']
+        length = reference_length if reference_length is not None else len(self.result['frequencies'])
+        lines = [
+            '##fileformat=VCFv4.2',
+            f'##contig=<ID={contig},length={length}>',
+            '##ALT=<ID=DEL,Description="Deletion of the whole reference">',
+            '##INFO=<ID=AC,Number=A,Type=Integer,Description="Samples carrying the allele">',
+            '##INFO=<ID=AF,Number=A,Type=Float,Description="Allele frequency in the panel">',
+            '##INFO=<ID=TYPE,Number=A,Type=String,Description="SNV, INS or DEL, joined with + when a sample combines them">',
+            '##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">',
+            '\t'.join(['#CHROM', 'POS', 'ID', 'REF', 'ALT', 'QUAL', 'FILTER', 'INFO', 'FORMAT', *samples]),
+        ]
+        for pos, group in calls.groupby('pos', sort=True):
+            # every reference allele at a position starts on the same base, the longest one covers all
+            ref = max(group['ref'], key=len)
+            start = pos - 1
+            alleles = [self._allele(b, start, start + len(ref)) for b in range(len(samples))]
+
+            kinds = {}
+            for b, called in self.__called[pos].items():
+                if alleles[b] != ref:
+                    kinds.setdefault(alleles[b], set()).update(called)
+            alts = sorted(kinds)
+            genotypes = []
+            for b, allele in enumerate(alleles):
+                if allele == ref:
+                    genotypes.append('0')
+                    continue
+                if allele not in kinds:
+                    if self.__panel[b, start] != self.GAP:
+                        genotypes.append('.')
+                        continue
+                    # the position lies inside a deletion called further upstream
+                    allele = '*'
+                    if allele not in kinds:
+                        kinds[allele] = {'DEL'}
+                        alts.append(allele)
+                genotypes.append(str(alts.index(allele) + 1))
+
+            counts = [genotypes.count(str(k + 1)) for k in range(len(alts))]
+            info = ';'.join([
+                'AC=' + ','.join(map(str, counts)),
+                'AF=' + ','.join(f'{c / len(samples):.4g}' for c in counts),
+                'TYPE=' + ','.join('+'.join(sorted(kinds[a])) for a in alts),
+            ])
+            lines.append('\t'.join([contig, str(pos), '.', ref, ','.join(alts), '.', 'PASS', info, 'GT', *genotypes]))
+        return '\n'.join(lines) + '\n'
+
+    def save_to_vcf(self, output_path, contig: str = 'reference'):
+        try:
+            with open(output_path, 'w') as f:
+                f.write(self.to_vcf(contig))
+            print(f"Successfully saved variants to {output_path} \n")
+        except Exception as e:
+            print(f"Error saving VCF file: {str(e)}, run variant calling first \n")
+
+    def report(self):
+        if not self.result:
+            print("No variant calling has been run.")
+            return
+        calls = self.result['calls']
+        print(f"Variant calls: {len(calls)}")
+        for kind, count in calls['type'].value_counts().items():
+            print(f"\t{kind}: {count}")
+        print(f"Consensus length: {len(self.result['consensus'])}\n")